@@ -11,77 +11,308 @@ Universidad de La Laguna – Escuela Superior de Ingeniería y Tecnología
 Trabajo de Fin de Grado en Ingeniería Informática
 Repositorio: https://github.com/PablodlFR/trivium-cipher-tfg.git
 """
-from bitstring import BitArray
+import textwrap
 
-def key_iv_setup(key, iv):
+import numpy as np
+from numba import njit, prange
+
+# Registros de desplazamiento de Trivium: (posición inicial en el estado, longitud)
+REGISTERS = ((0, 93), (93, 84), (177, 111))
+
+# Número de bits que se calculan en paralelo en cada iteración. Trivium lo permite porque todas las
+# tomas están al menos 64 posiciones después del inicio de su registro (la más cercana, s₆₅ o s₂₄₂,
+# está en la posición relativa 65), así que ningún bit nuevo se lee en la misma iteración.
+WORD = 64
+
+@njit(cache=True, boundscheck=False)
+def pack_state(bits):
   """
-  Configura el estado inicial del cifrado utilizando la clave y el vector de inicialización.
+  Empaqueta el estado lógico de 288 bits en dos palabras de 64 bits por registro. El bit p de
+  cada registro se guarda en el bit p % 64 de su palabra baja (p < 64) o alta (p >= 64).
 
   Args:
-    key (list[int]): lista de 80 bits que representan la clave.
-    iv (list[int]): lista de 80 bits que representan el vector de inicialización.
+    bits (np.ndarray): 288 bits (np.uint8) del estado en orden lógico.
 
   Returns:
-    state (list[int]): lista de 80 bits que representa el estado inicial del cifrado.
+    state (np.ndarray): 6 palabras (np.uint64) [A_bajo, A_alto, B_bajo, B_alto, C_bajo, C_alto].
   """
-  state = [0] * 288
+  state = np.zeros(6, dtype=np.uint64)
+  for r in range(3):
+    base, length = REGISTERS[r]
+    for p in range(length):
+      state[2 * r + p // WORD] |= np.uint64(bits[base + p]) << np.uint64(p % WORD)
+  return state
 
-  for i in range(80):
-    state[i] = key[i]
+def _tap(i):
+  """
+  Genera la expresión que extrae los valores que toma la posición i del estado durante los próximos
+  64 pasos, con los desplazamientos ya resueltos, sobre las palabras del estado guardadas en las
+  variables s0-s5. El bit b de la palabra corresponde al paso 63 - b, es decir, a la posición
+  i - 63 + b actual. Todas las tomas de Trivium cumplen 0 < i - 63 < 64 dentro de su registro.
 
-  for i in range(80):
-    state[93 + i] = iv[i]
+  Args:
+    i (int): posición lógica de la toma en el estado de 288 bits.
 
-  for i in range(3):
-    state[285 + i] = 1
+  Returns:
+    (str): expresión Python que calcula la palabra de la toma.
+  """
+  r = 0 if i < 93 else 1 if i < 177 else 2
+  w = i - REGISTERS[r][0] - (WORD - 1)
+  return f"((s{2 * r} >> np.uint64({w})) | (s{2 * r + 1} << np.uint64({WORD - w})))"
 
-  for i in range(4 * 288):
-    t1 = state[65] ^ (state[90] & state[91]) ^ state[92] ^ state[170]
-    t2 = state[161] ^ (state[174] & state[175]) ^ state[176] ^ state[263]
-    t3 = state[242] ^ (state[285] & state[286]) ^ state[287] ^ state[68]
+def _mask(r):
+  """
+  Devuelve la máscara de la palabra alta del registro r como literal para el código generado.
 
-    state = [t3] + state[:92] + [t1] + state[93:176] + [t2] + state[177:287]
+  Args:
+    r (int): índice del registro (0, 1 o 2).
+
+  Returns:
+    (str): expresión Python con la máscara de los bits válidos de la palabra alta.
+  """
+  return f"np.uint64({(1 << (REGISTERS[r][1] - WORD)) - 1})"
+
+def _round(output, indent):
+  """
+  Genera el código de una iteración (64 rondas) de Trivium sobre las variables s0-s5. Tras calcular
+  t₁, t₂ y t₃, los tres registros se desplazan 64 posiciones a la derecha insertando t₃, t₁ y t₂ al
+  principio de cada uno; los bits que sobrepasan la longitud del registro se descartan.
+
+  Args:
+    output (str): código que consume la palabra de salida z = t₁ ⊕ t₂ ⊕ t₃, o "" en la inicialización.
+    indent (str): sangría con la que se inserta el código.
+
+  Returns:
+    (str): código Python de la iteración.
+  """
+  return textwrap.indent(f"""\
+t1 = {_tap(65)} ^ {_tap(92)}
+t2 = {_tap(161)} ^ {_tap(176)}
+t3 = {_tap(242)} ^ {_tap(287)}
+{output}
+t1 = t1 ^ ({_tap(90)} & {_tap(91)}) ^ {_tap(170)}
+t2 = t2 ^ ({_tap(174)} & {_tap(175)}) ^ {_tap(263)}
+t3 = t3 ^ ({_tap(285)} & {_tap(286)}) ^ {_tap(68)}
+
+s1, s0 = s0 & {_mask(0)}, t3
+s3, s2 = s2 & {_mask(1)}, t1
+s5, s4 = s4 & {_mask(2)}, t2
+""", indent)
+
+def _generate(source, name):
+  """
+  Compila con Numba una función generada como código fuente.
+
+  Numba no puede cachear funciones creadas con exec, pero sí las funciones cacheadas que la llaman,
+  que la incluyen en su propio código compilado.
+
+  Args:
+    source (str): código Python de la función.
+    name (str): nombre de la función definida en source.
+
+  Returns:
+    (numba.core.registry.CPUDispatcher): la función compilada.
+  """
+  namespace = {"np": np}
+  exec(source, namespace)
+  return njit(boundscheck=False)(namespace[name])
+
+# Las tomas de Trivium son constantes, así que la ronda se genera como código lineal con los
+# desplazamientos y máscaras ya resueltos y el estado en variables locales en lugar de en un array.
+_initialization = _generate(f'''
+def _initialization(state):
+  """
+  Aplica al estado empaquetado las 4 * 288 = 1152 rondas de inicialización, 64 en cada iteración.
+  El estado se modifica en el sitio.
+  """
+  s0, s1, s2, s3, s4, s5 = state[0], state[1], state[2], state[3], state[4], state[5]
+
+  for i in range({4 * 288 // WORD}):
+{_round("", "    ")}
+  state[0], state[1], state[2], state[3], state[4], state[5] = s0, s1, s2, s3, s4, s5
+''', "_initialization")
+
+fill_key_stream = _generate(f'''
+def fill_key_stream(state, N, keystream):
+  """
+  Genera N bits de Keystream a partir del estado inicial y los escribe empaquetados en keystream,
+  empezando por el bit más significativo. El estado recibido no se modifica.
+
+  Args:
+    state (np.ndarray): 6 palabras (np.uint64) que representan el estado inicial.
+    N (int): número de bits necesarios para cifrar el texto.
+    keystream (np.ndarray): (N + 7) // 8 bytes (np.uint8) donde se escribe el flujo de clave.
+  """
+  s0, s1, s2, s3, s4, s5 = state[0], state[1], state[2], state[3], state[4], state[5]
 
+  for i in range((N + {WORD - 1}) // {WORD}):
+{_round(f"""
+z = t1 ^ t2 ^ t3
+for j in range(min({WORD // 8}, keystream.size - i * {WORD // 8})):
+  keystream[i * {WORD // 8} + j] = (z >> np.uint64({WORD - 8} - 8 * j)) & np.uint64(0xFF)
+""", "    ")}
+  # Descarta los bits sobrantes del último byte
+  if N % 8:
+    keystream[-1] &= np.uint8((0xFF << (8 - N % 8)) & 0xFF)
+''', "fill_key_stream")
+
+@njit(cache=True, boundscheck=False)
+def key_iv_setup(key, iv):
+  """
+  Configura el estado inicial del cifrado utilizando la clave y el vector de inicialización.
+
+  Args:
+    key (np.ndarray): 80 bits (np.uint8) que representan la clave.
+    iv (np.ndarray): 80 bits (np.uint8) que representan el vector de inicialización.
+
+  Returns:
+    state (np.ndarray): 6 palabras (np.uint64) que representan el estado inicial del cifrado.
+  """
+  bits = np.zeros(288, dtype=np.uint8)
+  bits[:80] = key
+  bits[93:173] = iv
+  bits[285:288] = 1
+
+  state = pack_state(bits)
+  _initialization(state)
   return state
 
+@njit(cache=True, boundscheck=False)
 def key_stream_generation(state, N):
   """
   Genera el Keystream usando el estado inicial. Se le pasa N para obtener solo la cantidad necesaria de bits para cifrar.
 
   Args:
-    state (list[int]): lista de 80 bits que representan el estado inicial.
+    state (np.ndarray): 6 palabras (np.uint64) que representan el estado inicial.
     N (int): número de bits necesarios para cifrar el texto.
 
   Returns:
-    keystream (list[int]): lista de bits que conforman el flujo de clave.
+    keystream (np.ndarray): bits del flujo de clave empaquetados en (N + 7) // 8 bytes (np.uint8),
+      empezando por el bit más significativo.
+  """
+  keystream = np.zeros((N + 7) // 8, dtype=np.uint8)
+  fill_key_stream(state, N, keystream)
+  return keystream
+
+_soa_rounds = _generate(f'''
+def _soa_rounds(states, words):
+  """
+  Aplica la inicialización a K instancias de Trivium a la vez y genera después su flujo de clave.
+  En cada iteración el bucle interno recorre las instancias, que no dependen entre sí.
+
+  Args:
+    states (np.ndarray): matriz (6, K) de palabras (np.uint64) con el estado de cada instancia en
+      formato SoA (la misma palabra de todas las instancias es contigua). Se modifica en el sitio.
+    words (np.ndarray): matriz (M, K) de palabras (np.uint64) donde se escriben las M palabras de
+      salida de cada instancia.
+  """
+  K = states.shape[1]
+
+  for i in range({4 * 288 // WORD}):
+    for k in range(K):
+      s0, s1, s2, s3, s4, s5 = states[0, k], states[1, k], states[2, k], states[3, k], states[4, k], states[5, k]
+{_round("", "      ")}
+      states[0, k], states[1, k], states[2, k], states[3, k], states[4, k], states[5, k] = s0, s1, s2, s3, s4, s5
+
+  for i in range(words.shape[0]):
+    for k in range(K):
+      s0, s1, s2, s3, s4, s5 = states[0, k], states[1, k], states[2, k], states[3, k], states[4, k], states[5, k]
+{_round("words[i, k] = t1 ^ t2 ^ t3", "      ")}
+      states[0, k], states[1, k], states[2, k], states[3, k], states[4, k], states[5, k] = s0, s1, s2, s3, s4, s5
+''', "_soa_rounds")
+
+@njit(cache=True, boundscheck=False)
+def fill_trivium_soa(keys, ivs, N, keystream):
+  """
+  Genera el flujo de clave de varias instancias independientes de Trivium avanzándolas a la vez
+  con la representación de 64 bits por iteración, y lo escribe empaquetado en keystream. El estado
+  se guarda en formato SoA, de modo que el bucle interno sobre las instancias no tiene dependencias
+  y puede vectorizarse.
+
+  Args:
+    keys (np.ndarray): matriz (K, 80) de bits (np.uint8) con la clave de cada instancia.
+    ivs (np.ndarray): matriz (K, 80) de bits (np.uint8) con el vector de inicialización de cada instancia.
+    N (int): número de bits del flujo de clave a generar por instancia.
+    keystream (np.ndarray): matriz (K, (N + 7) // 8) de bytes (np.uint8) donde se escribe el flujo
+      de clave de cada instancia.
+  """
+  K = keys.shape[0]
+  states = np.zeros((6, K), dtype=np.uint64)
+  words = np.empty(((N + WORD - 1) // WORD, K), dtype=np.uint64)
+
+  bits = np.zeros(288, dtype=np.uint8)
+  bits[285:288] = 1
+  for k in range(K):
+    bits[:80] = keys[k]
+    bits[93:173] = ivs[k]
+    states[:, k] = pack_state(bits)
+
+  _soa_rounds(states, words)
+
+  # Transpone las palabras de salida a bytes por instancia, empezando por el bit más significativo
+  for k in range(K):
+    for i in range(words.shape[0]):
+      z = words[i, k]
+      for j in range(min(WORD // 8, keystream.shape[1] - i * WORD // 8)):
+        keystream[k, i * WORD // 8 + j] = (z >> np.uint64(WORD - 8 - 8 * j)) & np.uint64(0xFF)
+
+  # Descarta los bits sobrantes del último byte
+  if N % 8:
+    keystream[:, -1] &= np.uint8((0xFF << (8 - N % 8)) & 0xFF)
+
+
+@njit(cache=True, boundscheck=False)
+def trivium_soa(keys, ivs, N):
+  """
+  Genera el flujo de clave de varias instancias independientes de Trivium en un solo núcleo.
+
+  Args:
+    keys (np.ndarray): matriz (K, 80) de bits (np.uint8) con la clave de cada instancia.
+    ivs (np.ndarray): matriz (K, 80) de bits (np.uint8) con el vector de inicialización de cada instancia.
+    N (int): número de bits del flujo de clave a generar por instancia.
+
+  Returns:
+    keystream (np.ndarray): matriz (K, (N + 7) // 8) de bytes (np.uint8) con el flujo de clave
+      empaquetado de cada instancia.
   """
-  keystream = [0] * N
-  for i in range(N):
-    t1 = state[65] ^ state[92]
-    t2 = state[161] ^ state[176]
-    t3 = state[242] ^ state[287]
+  keystream = np.empty((keys.shape[0], (N + 7) // 8), dtype=np.uint8)
+  fill_trivium_soa(keys, ivs, N, keystream)
+  return keystream
 
-    z = t1 ^ t2 ^ t3
-    keystream[i] = z
+@njit(cache=True, parallel=True)
+def key_stream_batch(keys, ivs, N):
+  """
+  Genera en paralelo el flujo de clave de varias instancias independientes de Trivium, incluida su
+  inicialización. Las instancias se reparten en bloques de 64 entre los núcleos disponibles y cada
+  bloque se procesa con fill_trivium_soa. Con un solo núcleo equivale a trivium_soa.
 
-    t1 = t1 ^ (state[90] & state[91]) ^ state[170]
-    t2 = t2 ^ (state[174] & state[175]) ^ state[263]
-    t3 = t3 ^ (state[285] & state[286]) ^ state[68]
+  Args:
+    keys (np.ndarray): matriz (K, 80) de bits (np.uint8) con la clave de cada instancia.
+    ivs (np.ndarray): matriz (K, 80) de bits (np.uint8) con el vector de inicialización de cada instancia.
+    N (int): número de bits del flujo de clave a generar por instancia.
 
-    state = [t3] + state[:92] + [t1] + state[93:176] + [t2] + state[177:287]
-  
+  Returns:
+    keystream (np.ndarray): matriz (K, (N + 7) // 8) de bytes (np.uint8) con el flujo de clave
+      empaquetado de cada instancia.
+  """
+  K = keys.shape[0]
+  keystream = np.empty((K, (N + 7) // 8), dtype=np.uint8)
+  for b in prange((K + WORD - 1) // WORD):
+    lo, hi = b * WORD, min((b + 1) * WORD, K)
+    fill_trivium_soa(keys[lo:hi], ivs[lo:hi], N, keystream[lo:hi])
   return keystream
 
 # -------------------------------------
 
-# Clave e IV
-key = BitArray("0x0123456789ABCDEF1234")
-iv = BitArray("0x0123456789ABCDEF1234")
+if __name__ == "__main__":
+  # Clave e IV
+  key = np.unpackbits(np.frombuffer(bytes.fromhex("0123456789ABCDEF1234"), dtype=np.uint8))
+  iv = np.unpackbits(np.frombuffer(bytes.fromhex("0123456789ABCDEF1234"), dtype=np.uint8))
 
-n = 256  # Nº de bits del flujo de clave
+  n = 256  # Nº de bits del flujo de clave
 
-# Inicializar Trivium
-state = key_iv_setup(key, iv)
-keystream = BitArray(key_stream_generation(state, n))
+  # Inicializar Trivium
+  state = key_iv_setup(key, iv)
+  keystream = key_stream_generation(state, n)
 
-print(f"Flujo de clave:", keystream.hex.upper())
\ No newline at end of file
+  print(f"Flujo de clave:", keystream.tobytes().hex().upper())
\ No newline at end of file
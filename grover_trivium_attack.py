@@ -13,181 +13,186 @@ Trabajo de Fin de Grado en Ingeniería Informática
 Repositorio: https://github.com/PablodlFR/trivium-cipher-tfg.git
 """
 import time
-from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit
-from qiskit_aer.aerprovider import QasmSimulator
+from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit, transpile
+from qiskit_aer import AerSimulator
 from collections import Counter
 
-backend = QasmSimulator(method='matrix_product_state')
+# Si Aer está compilado con cuQuantum, usa el simulador de redes tensoriales en GPU (cuTensorNet),
+# que escala mejor con el número de Toffolis del oráculo. Si no, usa el simulador MPS en CPU.
+if 'tensor_network' in AerSimulator().available_methods():
+  backend = AerSimulator(method='tensor_network', device='GPU')
+else:
+  backend = AerSimulator(method='matrix_product_state')
 
-def state_update(qc, s, t, a, b, c, d, e, t_index):
+class TriviumRegister:
   """
-  Actualiza los qubits correspondientes a t₀, t₁ y t₂ utilizando ciertos qubits específicos del estado s.
+  Estado interno de Trivium sobre un registro circular de 288 qubits. Los tres registros de Trivium
+  se tratan como uno solo y el desplazamiento se realiza reetiquetando los qubits mediante un índice
+  rotatorio, de modo que desplazar el estado no emite ninguna puerta.
 
   Args:
-    qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
     s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    t (QuantumRegister): registro temporal (3 qubits) para t₀, t₁ y t₂.
-    a, b, c, d, e (int): índice de qubits en el registro s.
-    t_index (int): índice del registro t donde se guarda el resultado.
   """
-  qc.cx(s[a], s[d])                  # CNOT(a, d)
-  qc.ccx(s[b], s[c], s[d])           # TOFFOLI(b, c, d)
-  qc.cx(s[e], s[d])                  # CNOT(e, d)
-  qc.swap(s[d], t[t_index])          # SWAP(d, tᵢ)
-
-def state_shifting(qc, s, a, b, t):
+  def __init__(self, s):
+    self.s = s
+    self.off = 0
+
+  def __getitem__(self, i):
+    """
+    Devuelve el qubit físico que ocupa la posición lógica i del estado.
+    """
+    return self.s[(self.off + i) % 288]
+
+  def shift_right(self):
+    """
+    Desplaza el estado una posición a la derecha: la posición lógica j pasa a ser la j+1, de modo
+    que s[92], s[176] y s[287] pasan a ser s[93], s[177] y s[0].
+    """
+    self.off = (self.off - 1) % 288
+
+  def shift_left(self):
+    """
+    Igual que shift_right, pero realiza el desplazamiento hacia la izquierda.
+    """
+    self.off = (self.off + 1) % 288
+
+def state_update(qc, s, a, b, c, d, e):
   """
-  Realiza un desplazamiento a la derecha sobre una sección del registro s, trasladando todos los qubits entre
-  las posiciones a y b una posición a la derecha y copiando el valor del registro t en la posición s[b].
+  Calcula t₀, t₁ o t₂ sobre el qubit d utilizando ciertos qubits específicos del estado s. Como d es la
+  última posición de su registro, tras el desplazamiento pasa a ser la primera del registro siguiente.
 
   Args:
     qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
-    s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    a (int): índice del último qubit del segmento a desplazar.
-    b (int): índice del primer qubit del segmento a desplazar (posición final del nuevo valor).
-    t (qubit): qubit temporal (tᵢ) que se insertará en s[b].
+    s (TriviumRegister): estado interno del cifrado (288 qubits).
+    a, b, c, d, e (int): posición lógica de los qubits en el estado s.
   """
-  j = a
-  while j >= b:
-    if j == b:
-      qc.swap(s[b], t)
-    else:
-      qc.swap(s[j], s[j-1])      
-    j = j - 1
-    
-def update_t(qc, s, t, a, b, t_index):
+  qc.cx(s[a], s[d])                  # CNOT(a, d)
+  qc.ccx(s[b], s[c], s[d])           # TOFFOLI(b, c, d)
+  qc.cx(s[e], s[d])                  # CNOT(e, d)
+
+def keystream_bit(qc, s, z):
   """
-  Calcula tᵢ como la suma XOR entre dos qubits específicos del estado s y guarda el resultado en t[t_index].
+  Calcula el bit del flujo de clave como la suma XOR de s₆₅, s₉₂, s₁₆₁, s₁₇₆, s₂₄₂ y s₂₈₇, escribiéndolo
+  directamente sobre el qubit z sin necesidad de registros temporales.
 
   Args:
     qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
-    s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    t (QuantumRegister): registro temporal (3 qubits) para t₀, t₁ y t₂.
-    a (int): primer índice del qubit involucrado en la operación XOR.
-    b (int): segúndo índice del qubit involucrado en la operación XOR.
-    t_index (int): índice del registro t donde se guarda el resultado.
+    s (TriviumRegister): estado interno del cifrado (288 qubits).
+    z (Qubit): qubit del flujo de clave donde se guarda el resultado.
   """
-  qc.cx(s[a], s[b])
-  qc.swap(s[b], t[t_index])
+  for i in (65, 92, 161, 176, 242, 287):
+    qc.cx(s[i], z)
 
-def trivium(qc, s, t, rounds, n):
+def trivium(qc, s, rounds, n):
   """
-  Implementa el cifrado Trivium en un circuito cuántico.
+  Implementa el cifrado Trivium en un circuito cuántico. Al terminar, el estado s queda desplazado
+  rounds + n posiciones, tal y como lo espera inv_trivium.
 
   Args:
     qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
-    s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    t (QuantumRegister): registro temporal (3 qubits) para t₀, t₁ y t₂.
+    s (TriviumRegister): estado interno del cifrado (288 qubits).
     round (int): número de rondas de inicialización.
     n (int): número de bits del flujo de clave a generar.
   """
   # Inicialización del estado interno
   for _ in range(rounds):
-    state_update(qc, s, t, 65, 90, 91, 92, 170, 0)      
-    state_update(qc, s, t, 161, 174, 175, 176, 263, 1)  
-    state_update(qc, s, t, 242, 285, 286, 287, 68, 2) 
+    state_update(qc, s, 65, 90, 91, 92, 170)
+    state_update(qc, s, 161, 174, 175, 176, 263)
+    state_update(qc, s, 242, 285, 286, 287, 68)
 
-    state_shifting(qc, s, 287, 177, t[1])
-    state_shifting(qc, s, 176, 93, t[0])
-    state_shifting(qc, s, 92, 0, t[2])
+    s.shift_right()
 
   # Generador del flujo de clave
   for i in range(n):
-    update_t(qc, s, t, 65, 92, 0)
-    update_t(qc, s, t, 161, 176, 1)
-    update_t(qc, s, t, 242, 287, 2)
-
-    qc.cx(t[0], z[i])
-    qc.cx(t[1], z[i])
-    qc.cx(t[2], z[i])
-
-    qc.ccx(s[90], s[91], t[0])
-    qc.cx(s[170], t[0])
-    qc.ccx(s[174], s[175], t[1])
-    qc.cx(s[263], t[1])
-    qc.ccx(s[285], s[286], t[2])
-    qc.cx(s[68], t[2])
-
-    state_shifting(qc, s, 287, 177, t[1])
-    state_shifting(qc, s, 176, 93, t[0])
-    state_shifting(qc, s, 92, 0, t[2]) 
-
-def inv_state_update(qc, s, t, a, b, c, d, e, t_index):
+    keystream_bit(qc, s, z[i])
+
+    state_update(qc, s, 65, 90, 91, 92, 170)
+    state_update(qc, s, 161, 174, 175, 176, 263)
+    state_update(qc, s, 242, 285, 286, 287, 68)
+
+    s.shift_right()
+
+def inv_state_update(qc, s, a, b, c, d, e):
   """
   Versión inversa de la función state_update.
   """
-  qc.swap(s[d], t[t_index])          # SWAP(d, tᵢ)
   qc.cx(s[e], s[d])                  # CNOT(e, d)
   qc.ccx(s[b], s[c], s[d])           # TOFFOLI(b, c, d)
   qc.cx(s[a], s[d])                  # CNOT(a, d)
 
-def state_shifting_left(qc, s, a, b, t):
+def inv_trivium(qc, s, rounds, n):
   """
-  Igual que state_shifting, pero realiza el desplazamiento hacia la izquierda.
+  Versión inversa de la función trivium. Devuelve el estado s a su desplazamiento inicial.
   """
-  for j in range(b, a + 1):
-    if j == b:
-      qc.swap(s[b], t)
-    else:
-      qc.swap(s[j], s[j - 1])
+  # Generador del flujo de clave
+  for i in range(n):
+    s.shift_left()
 
-def inv_update_t(qc, s, t, a, b, t_index):
-  """
-  Versión inversa de la función update_t.
-  """
-  qc.swap(s[b], t[t_index])
-  qc.cx(s[a], s[b])
+    inv_state_update(qc, s, 242, 285, 286, 287, 68)
+    inv_state_update(qc, s, 161, 174, 175, 176, 263)
+    inv_state_update(qc, s, 65, 90, 91, 92, 170)
 
-def inv_trivium(qc, s, t, rounds, n):
-  """
-  Versión inversa de la función trivium. 
-  """
-  # Generador del flujo de clave
-  for i in range(n):        
-    state_shifting_left(qc, s, 92, 0, t[2])
-    state_shifting_left(qc, s, 176, 93, t[0])
-    state_shifting_left(qc, s, 287, 177, t[1])        
-
-    qc.cx(s[68], t[2])
-    qc.ccx(s[285], s[286], t[2])
-    qc.cx(s[263], t[1])
-    qc.ccx(s[174], s[175], t[1])
-    qc.cx(s[170], t[0])
-    qc.ccx(s[90], s[91], t[0])
-    
     # Escribe en orden inverso z[2], z[1], z[0]
-    qc.cx(t[2],z[n-1-i])
-    qc.cx(t[1],z[n-1-i])
-    qc.cx(t[0],z[n-1-i])
-    
-    inv_update_t(qc, s, t, 242, 287, 2)
-    inv_update_t(qc, s, t, 161, 176, 1)
-    inv_update_t(qc, s, t, 65, 92, 0)            
+    keystream_bit(qc, s, z[n-1-i])
   
   # Inicialización del estado interno
-  for i in range(rounds):         
-    state_shifting_left(qc, s, 92, 0, t[2])
-    state_shifting_left(qc, s, 176, 93, t[0])
-    state_shifting_left(qc, s, 287, 177, t[1])
-
-    inv_state_update(qc, s, t, 242, 285, 286, 287, 68, 2)   
-    inv_state_update(qc, s, t, 161, 174, 175, 176, 263, 1)  
-    inv_state_update(qc, s, t, 65, 90, 91, 92, 170, 0)  
+  for i in range(rounds):
+    s.shift_left()
+
+    inv_state_update(qc, s, 242, 285, 286, 287, 68)
+    inv_state_update(qc, s, 161, 174, 175, 176, 263)
+    inv_state_update(qc, s, 65, 90, 91, 92, 170)
         
 # -----------------
 
-def oracle(qc, r_key, r_ancilla, rev_ks, z, r_output, n, rounds):
+def and_tree(qc, controls, target, r_ancilla):
+  """
+  Activa target si todos los qubits de controls valen 1. En lugar de una única MCX, reduce los
+  controles por parejas con un árbol de puertas Toffoli de profundidad logarítmica, guardando los
+  resultados intermedios en r_ancilla, y después deshace el árbol para limpiar los ancillas.
+
+  Args:
+    qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
+    controls (QuantumRegister): qubits de control.
+    target (Qubit): qubit que se invierte si todos los controles valen 1.
+    r_ancilla (QuantumRegister): registro auxiliar de len(controls) - 2 qubits inicializados a 0.
+  """
+  level = list(controls)
+  free = list(r_ancilla)
+  tree = []
+
+  while len(level) > 2:
+    next_level = []
+    for i in range(0, len(level) - 1, 2):
+      ancilla = free.pop(0)
+      qc.ccx(level[i], level[i + 1], ancilla)
+      tree.append((level[i], level[i + 1], ancilla))
+      next_level.append(ancilla)
+    if len(level) % 2:
+      next_level.append(level[-1])
+    level = next_level
+
+  if len(level) == 2:
+    qc.ccx(level[0], level[1], target)
+  else:
+    qc.cx(level[0], target)
+
+  # Deshace el árbol (limpiar ancilla)
+  for a, b, ancilla in reversed(tree):
+    qc.ccx(a, b, ancilla)
+
+def oracle(qc, r_key, known_ks, z, r_ancilla, r_output, n, rounds):
   """
   Compara una clave candidata con un flujo de clave conocido. Si la clave es correcta (es decir,
   genera el flujo de clave esperado), invierte la fase del estado cuántico asociado a la clave
-  correcta, utilizando r_output como marcador de fase, mediante una puerta MCX.
+  correcta, utilizando r_output como marcador de fase, mediante un árbol de puertas Toffoli.
 
   Args:
     qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
     r_key (QuantumRegister): registro de n qubits que contiene la clave parcial desconocida.
-    r_ancilla (QuantumRegister): registro auxiliar para comparar flujos.
-    rev_ks (QuantumRegister): registro con el flujo de clave conocido.
+    known_ks (str): flujo de clave conocido. Al ser clásico no necesita registro propio.
     z (QuantumRegister): registro donde se genera el flujo de clave simulado.
+    r_ancilla (QuantumRegister): registro auxiliar de n - 2 qubits para el árbol de comparación.
     r_output (QuantumRegister): qubit usado para marcar la solución (fase invertida).
     n (int): número de bits del flujo de clave.
     rounds (int): número de rondas de inicialización de Trivium.
@@ -198,25 +203,26 @@ def oracle(qc, r_key, r_ancilla, rev_ks, z, r_output, n, rounds):
     qc.cx(r_key[i], s[51+i])
 
   # Ejecuta Trivium para generar el flujo de clave
-  trivium(qc, s, t, rounds, n)
+  state = TriviumRegister(s)
+  trivium(qc, state, rounds, n)
   
-  # Compara el flujo de clave generado con el esperado
+  # Compara el flujo de clave generado con el esperado: niega los bits de z que deben valer 0,
+  # de modo que z queda a todo unos solo si coincide con el flujo conocido
   for i in range(n):
-    qc.cx(rev_ks[i], r_ancilla[i])  # XOR con el flujo conocido
-    qc.cx(z[i], r_ancilla[i])       # XOR con el flujo generado
-    qc.x(r_ancilla[i])              # Si coinciden se pone a 1
+    if (known_ks[i] == "0"):
+      qc.x(z[i])
       
   # Si todos los bits coinciden, activa r_output
-  qc.mcx(r_ancilla, r_output)    
+  and_tree(qc, z, r_output[0], r_ancilla)
   
-  # Deshace la comparación (limpiar ancilla)
+  # Deshace la comparación
   for i in range(n):
-    qc.x(r_ancilla[i])
-    qc.cx(rev_ks[i], r_ancilla[i])
-    qc.cx(z[i], r_ancilla[i])
+    if (known_ks[i] == "0"):
+      qc.x(z[i])
   
-  # Deshace Trivium y quitar la clave insertada
-  inv_trivium(qc, s, t, rounds, n)
+  # Deshace Trivium y quitar la clave insertada. Es necesario incluso con una sola iteración: el
+  # difusor solo hace interferir las claves candidatas si s y z vuelven a su estado inicial
+  inv_trivium(qc, state, rounds, n)
   
   for i in range(n):
     qc.cx(r_key[i], s[51+i])
@@ -258,23 +264,16 @@ def diffuser(nqubits):
 n = 3          # Número de qubits de la clave a recuperar
 rounds = 200   # Número de rondas que ejecuta Trivium
 s = QuantumRegister(288)           # Registro estado de Trivium de 288 qubits
-t = QuantumRegister(3, name='t')   # Registros temporales t1, t2, t3
 z = QuantumRegister(n, name='z')   # Registro para el flujo de clave
 r_key = QuantumRegister(n, name='r_key')         # Registro que representa los qubits de clave desconocidos
 r_output = QuantumRegister(1, name='r_output')   # Registro de 1 qubit usado por el oráculo para marcar la clave correcta
-rev_ks = QuantumRegister(n, name='rev_ks')       # Registro con el flujo de clave conocido (para comparar en el oráculo)
-r_ancilla = QuantumRegister(n, name='r_ancilla') # Registro auxiliar para comparar el flujo de clave generado y el esperado
+r_ancilla = QuantumRegister(max(n - 2, 0), name='r_ancilla') # Registro auxiliar para el árbol de comparación del oráculo
 r_class = ClassicalRegister(n, name='r_class')   # Registro clásico para medir los qubits de la clave (r_key)
 
-qc = QuantumCircuit(s, t, z, r_key, rev_ks, r_ancilla, r_output, r_class)
+qc = QuantumCircuit(s, z, r_key, r_ancilla, r_output, r_class)
 
 known_ks = '001' # Flujo de clave conocido utilizado como referencia en el oráculo
 
-# Inicializa el registro rev_ks con los 3 qubits del flujo de clave conocido
-for i in range(n):
-  if (known_ks[i] == "1"):
-    qc.x(rev_ks[i])
-
 qc.h(r_key)
 
 # Inicializar key (los 3 bits desconocidos se omiten)
@@ -308,7 +307,7 @@ time_start = time.process_time()
 
 # 1. Aplicar oráculo de Grover para marcar el estado solución
 # 2. Aplicar el difusor (amplifica la probabilidad del estado marcado)
-oracle(qc, r_key, r_ancilla, rev_ks, z, r_output, n, rounds)
+oracle(qc, r_key, known_ks, z, r_ancilla, r_output, n, rounds)
 qc.append(diffuser(n), r_key)
 
 qc.measure(r_key, r_class) 
@@ -316,7 +315,10 @@ qc.measure(r_key, r_class)
 #---------------------------------------------
 
 # Ejecuta el circuito y obtiene los resultados
-result = backend.run(qc.decompose(reps=1), shots=1024).result()
+# Se transpila una sola vez a puertas que el simulador admite directamente. A diferencia de
+# qc.decompose, las Toffoli se conservan en lugar de descomponerse en puertas T y CNOT.
+tqc = transpile(qc, basis_gates=['x', 'h', 'u', 'cx', 'ccx'], optimization_level=2)
+result = backend.run(tqc, shots=1024).result()
 counts = result.get_counts()
 
 # Invierte las cadenas de bits (porque Qiskit usa orden little endian)
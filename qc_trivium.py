@@ -16,66 +16,67 @@ from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
 from qiskit_aer import QasmSimulator
 from bitstring import BitArray
 
-def state_update(qc, s, t, a, b, c, d, e, t_index):
+class TriviumRegister:
   """
-  Actualiza los qubits correspondientes a t₀, t₁ y t₂ utilizando ciertos qubits específicos del estado s.
+  Estado interno de Trivium sobre un registro circular de 288 qubits. Los tres registros de Trivium
+  se tratan como uno solo y el desplazamiento se realiza reetiquetando los qubits mediante un índice
+  rotatorio, de modo que desplazar el estado no emite ninguna puerta.
 
   Args:
-    qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
     s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    t (QuantumRegister): registro temporal (3 qubits) para t₀, t₁ y t₂.
-    a, b, c, d, e (int): índice de qubits en el registro s.
-    t_index (int): índice del registro t donde se guarda el resultado.
   """
-  qc.cx(s[a], s[d])                  # CNOT(a, d)
-  qc.ccx(s[b], s[c], s[d])           # TOFFOLI(b, c, d)
-  qc.cx(s[e], s[d])                  # CNOT(e, d)
-  qc.swap(s[d], t[t_index])          # SWAP(d, tᵢ)
-
-def state_shifting(qc, s, a, b, t):
+  def __init__(self, s):
+    self.s = s
+    self.off = 0
+
+  def __getitem__(self, i):
+    """
+    Devuelve el qubit físico que ocupa la posición lógica i del estado.
+    """
+    return self.s[(self.off + i) % 288]
+
+  def shift_right(self):
+    """
+    Desplaza el estado una posición a la derecha: la posición lógica j pasa a ser la j+1, de modo
+    que s[92], s[176] y s[287] pasan a ser s[93], s[177] y s[0].
+    """
+    self.off = (self.off - 1) % 288
+
+def state_update(qc, s, a, b, c, d, e):
   """
-  Realiza un desplazamiento a la derecha sobre una sección del registro s, trasladando todos los qubits entre
-  las posiciones a y b una posición a la derecha y copiando el valor del registro t en la posición s[b].
+  Calcula t₀, t₁ o t₂ sobre el qubit d utilizando ciertos qubits específicos del estado s. Como d es la
+  última posición de su registro, tras el desplazamiento pasa a ser la primera del registro siguiente.
 
   Args:
     qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
-    s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    a (int): índice del último qubit del segmento a desplazar.
-    b (int): índice del primer qubit del segmento a desplazar (posición final del nuevo valor).
-    t (qubit): qubit temporal (tᵢ) que se insertará en s[b].
+    s (TriviumRegister): estado interno del cifrado (288 qubits).
+    a, b, c, d, e (int): posición lógica de los qubits en el estado s.
   """
-  j = a
-  while j >= b:
-    if j == b:
-      qc.swap(s[b], t)
-    else:
-      qc.swap(s[j], s[j-1])      
-    j = j - 1
-    
-def update_t(qc, s, t, a, b, t_index):
+  qc.cx(s[a], s[d])                  # CNOT(a, d)
+  qc.ccx(s[b], s[c], s[d])           # TOFFOLI(b, c, d)
+  qc.cx(s[e], s[d])                  # CNOT(e, d)
+
+def keystream_bit(qc, s, z):
   """
-  Calcula tᵢ como la suma XOR entre dos qubits específicos del estado s y guarda el resultado en t[t_index].
+  Calcula el bit del flujo de clave como la suma XOR de s₆₅, s₉₂, s₁₆₁, s₁₇₆, s₂₄₂ y s₂₈₇, escribiéndolo
+  directamente sobre el qubit z sin necesidad de registros temporales.
 
   Args:
     qc (QuantumCircuit): el circuito cuántico sobre el que se trabaja.
-    s (QuantumRegister): registro que representa el estado interno del cifrado (288 qubits).
-    t (QuantumRegister): registro temporal (3 qubits) para t₀, t₁ y t₂.
-    a (int): primer índice del qubit involucrado en la operación XOR.
-    b (int): segúndo índice del qubit involucrado en la operación XOR.
-    t_index (int): índice del registro t donde se guarda el resultado.
+    s (TriviumRegister): estado interno del cifrado (288 qubits).
+    z (Qubit): qubit del flujo de clave donde se guarda el resultado.
   """
-  qc.cx(s[a], s[b])
-  qc.swap(s[b], t[t_index])
+  for i in (65, 92, 161, 176, 242, 287):
+    qc.cx(s[i], z)
 
 # -------------------------------------
 
 r = 256                             # Número de qubits del flujo de clave
 s = QuantumRegister(288, name='s')  # Registro estado de Trivium de 288 qubits
-t = QuantumRegister(3, name='t')    # Registros temporales t1, t2, t3
 z = QuantumRegister(r, name='z')    # Registro cuántico para el flujo de clave
 c = ClassicalRegister(r, name='c')  # Registro clásico para medir el flujo de clave
 
-qc = QuantumCircuit(s, t, z, c)
+qc = QuantumCircuit(s, z, c)
 
 key = BitArray(hex="0x0123456789abcdef1234")
 iv = BitArray(hex="0x0123456789abcdef1234")
@@ -96,39 +97,28 @@ qc.x(s[286])
 qc.x(s[287])
 
 # Inicialización del estado interno. 4 ciclos (4 * 288 = 1152 rondas)
+state = TriviumRegister(s)
 for _ in range(1152):
-  state_update(qc, s, t, 65, 90, 91, 92, 170, 0) 
-  state_update(qc, s, t, 161, 174, 175, 176, 263, 1) 
-  state_update(qc, s, t, 242, 285, 286, 287, 68, 2) 
+  state_update(qc, state, 65, 90, 91, 92, 170)
+  state_update(qc, state, 161, 174, 175, 176, 263)
+  state_update(qc, state, 242, 285, 286, 287, 68)
 
-  state_shifting(qc, s, 287, 177, t[1])
-  state_shifting(qc, s, 176, 93, t[0])
-  state_shifting(qc, s, 92, 0, t[2])
+  state.shift_right()
 
 # Generador del flujo de clave
 for i in range(r):
-  update_t(qc, s, t, 65, 92, 0)
-  update_t(qc, s, t, 161, 176, 1)
-  update_t(qc, s, t, 242, 287, 2)
-
-  qc.cx(t[0], z[i])
-  qc.cx(t[1], z[i])
-  qc.cx(t[2], z[i])
-
-  qc.ccx(s[90], s[91], t[0])
-  qc.cx(s[170], t[0])
-  qc.ccx(s[174], s[175], t[1])
-  qc.cx(s[263], t[1])
-  qc.ccx(s[285], s[286], t[2])
-  qc.cx(s[68], t[2])
-  
-  state_shifting(qc, s, 287, 177, t[1])
-  state_shifting(qc, s, 176, 93, t[0])
-  state_shifting(qc, s, 92, 0, t[2])
+  keystream_bit(qc, state, z[i])
+
+  state_update(qc, state, 65, 90, 91, 92, 170)
+  state_update(qc, state, 161, 174, 175, 176, 263)
+  state_update(qc, state, 242, 285, 286, 287, 68)
+
+  state.shift_right()
 
 qc.measure(z, c)
 
-# Simulación
+# Simulación. El circuito parte de un estado de la base computacional y solo aplica puertas X, CNOT y
+# Toffoli, así que el estado es siempre un producto de qubits (dimensión de enlace 1 en el MPS).
 simulator = QasmSimulator(method='matrix_product_state')
 job = simulator.run(qc, shots=1, memory = True)
 result = job.result()